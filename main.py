@@ -9,11 +9,12 @@ from langchain.prompts import PromptTemplate
 import tiktoken
 import os
 import openai
+from concurrent.futures import ThreadPoolExecutor
 from selenium import webdriver
 from selenium.webdriver.chrome.options import Options
 from selenium.webdriver.common.by import By
 from langchain_openai import ChatOpenAI
-from langchain.schema import AIMessage
+from langchain.schema import AIMessage, SystemMessage, HumanMessage
 from scrapegraphai.graphs import SmartScraperGraph
 from scrapegraphai.utils import prettify_exec_info
 import psycopg2
@@ -84,8 +85,10 @@ def create_tables_if_not_exist(conn):
             text_of_article TEXT,
             receiver_country TEXT[],
             date TEXT,
-            total_amount FLOAT
+            total_amount FLOAT,
+            financed_name TEXT
         );
+        ALTER TABLE updates ADD COLUMN IF NOT EXISTS financed_name TEXT;
         """)
     conn.commit()
 
@@ -139,12 +142,21 @@ def insert_organization_data(conn, extracted_data):
 
 # Function to insert other data into the 'updates' table
 def insert_update_data(conn, extracted_data):
+    # Keep the name of the financed project or organization so a stored update can be rewritten later
+    if extracted_data['receiverCategory'] == 'Project':
+        financed_name = extracted_data.get('projectFinanced')
+    elif extracted_data['receiverCategory'] == 'Organization' and extracted_data.get('organizationFinanced'):
+        financed_name = extracted_data['organizationFinanced'].get('name')
+    else:
+        financed_name = None
+
     try:
         with conn.cursor() as cursor:
             cursor.execute(
                 """
-                INSERT INTO updates (title, news_update_type, receiver_category, text_of_article, receiver_country, date, total_amount)
-                VALUES (%s, %s, %s, %s, %s, %s, %s);
+                INSERT INTO updates (title, news_update_type, receiver_category, text_of_article, receiver_country, date, total_amount, financed_name)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+                RETURNING id;
                 """,
                 (
                     extracted_data['title'], 
@@ -153,12 +165,56 @@ def insert_update_data(conn, extracted_data):
                     extracted_data['textOfArticle'],
                     '{' + ','.join(extracted_data['receiverCountry']) + '}',
                     extracted_data['date'], 
-                    extracted_data['totalAmount']
+                    extracted_data['totalAmount'],
+                    financed_name
                 )
             )
+            update_id = cursor.fetchone()[0]
         conn.commit()
+        return update_id
     except Exception as e:
         print(f"Error inserting update data: {e}")
+        return None
+
+# Function to fetch a stored update from the 'updates' table in the shape of extracted data
+def fetch_update_data(conn, update_id):
+    with conn.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT title, news_update_type, receiver_category, text_of_article, receiver_country, date, total_amount, financed_name
+            FROM updates WHERE id = %s;
+            """,
+            (update_id,)
+        )
+        row = cursor.fetchone()
+
+    if row is None:
+        return None
+
+    financed = {"name": row[7]} if row[7] else None
+
+    # Sub-updates are not linked to their update row, so a stored update never carries them
+    return {
+        "title": row[0],
+        "newsUpdateType": row[1],
+        "receiverCategory": row[2],
+        "textOfArticle": row[3],
+        "receiverCountry": row[4],
+        "date": row[5],
+        "totalAmount": row[6],
+        "projectFinanced": financed if row[2] == 'Project' else None,
+        "organizationFinanced": financed if row[2] == 'Organization' else None,
+        "subUpdates": []
+    }
+
+# Create missing tables and columns on startup, so databases created before a schema change are migrated
+@app.on_event("startup")
+def migrate_database():
+    conn = get_db_connection()
+    try:
+        create_tables_if_not_exist(conn)
+    finally:
+        conn.close()
 
 #-----------DB Schema End-----------------
 
@@ -373,12 +429,20 @@ def generate_original_text(article: str) -> Dict:
         extracted_data = parser.parse(content)
         return extracted_data.dict()
 
+# Fixed rewrite instructions, sent as the system message so they form a prefix shared by every article
+REWRITE_INSTRUCTIONS = """
+        Assume you are an expert in re-generating an article. Based on the extracted data about a solar power plant given by the user, 
+        generate an article consisting of 600 words.
+
+        Ensure the article is clear, informative, and fits within 600 words.
+    """
+
 # Function to regenerate article
-def regenerate_article(extracted_data: Dict) -> Dict:
+def regenerate_article(extracted_data: Dict, system_prompt: Optional[str] = None) -> Dict:
     title = extracted_data.get('title')
     newsUpdateType = extracted_data.get('newsUpdateType')
-    recieverCategory = extracted_data.get('recieverCategory')
-    recieverCountry = extracted_data.get('recieverCountry')
+    recieverCategory = extracted_data.get('receiverCategory')
+    recieverCountry = extracted_data.get('receiverCountry')
     date = extracted_data.get('date')
     projectFinanced = extracted_data.get('projectFinanced')
     project_name = projectFinanced.get('name', 'Unknown') if projectFinanced else 'Unknown'
@@ -386,12 +450,9 @@ def regenerate_article(extracted_data: Dict) -> Dict:
     organizationFinanced = extracted_data.get('organizationFinanced')
     organization_name = organizationFinanced.get('name', 'Unknown') if organizationFinanced else 'Unknown'
 
-    sub_updates = [sub['organization'] + ' (' + sub['role'] + ')' for sub in extracted_data.get('subUpdates', [])]
+    sub_updates = [sub['organization'] + ' (' + sub['role'] + ')' for sub in extracted_data.get('subUpdates') or []]
 
     regenerate_prompt = f"""
-        Assume you are an expert in re-generating an article. Based on the following extracted data about a solar power plant, 
-        generate an article consisting of 600 words:
-
             Title: {title}
             News Update Type: {newsUpdateType}
             Receiver Category: {recieverCategory}
@@ -399,11 +460,11 @@ def regenerate_article(extracted_data: Dict) -> Dict:
             Date: {date}
             Project Financed: {project_name}
             Organization Financed: {organization_name}
-
-        Ensure the article is clear, informative, and fits within 600 words.
     """
 
-    response = model(regenerate_prompt)
+    # Only the per-article data goes after the shared system message, so the provider can cache the common prefix
+    system_content = system_prompt + "\n" + REWRITE_INSTRUCTIONS if system_prompt else REWRITE_INSTRUCTIONS
+    response = model([SystemMessage(content=system_content), HumanMessage(content=regenerate_prompt)])
     
     if isinstance(response, AIMessage):  
         generated_content = response.content  
@@ -440,10 +501,51 @@ class RequestDataForDB(BaseModel):
             return value['name']
         return value
 
+# Data models for a prior extraction passed in for rewriting
+class RewriteSubUpdate(BaseModel):
+    organization: str
+    role: str
+
+class RewriteData(BaseModel):
+    title: Optional[str] = None
+    newsUpdateType: Optional[str] = None
+    receiverCategory: Optional[str] = None
+    receiverCountry: Union[List[str], str, None] = None
+    date: Optional[str] = None
+    projectFinanced: Optional[Dict[str, Any]] = None
+    organizationFinanced: Optional[Dict[str, Any]] = None
+    subUpdates: Optional[List[RewriteSubUpdate]] = None
+
+    @validator('projectFinanced', 'organizationFinanced', pre=True)
+    def wrap_financed_name(cls, value: Union[str, Dict[str, Any], None]) -> Optional[Dict[str, Any]]:
+        if isinstance(value, str):
+            return {"name": value}
+        return value
+
 # Pydantic model for request data
 class RequestData(BaseModel):
     input: Union[str, None] = None  
 
+# Pydantic model for article rewriting, from raw input or a prior extraction
+class GenerateArticleRequest(BaseModel):
+    input: Optional[str] = None
+    extractedData: Optional[RewriteData] = None
+    updateId: Optional[int] = None
+    systemPrompt: Optional[str] = None
+
+# Pydantic models for batch article rewriting
+class RewriteItem(BaseModel):
+    extractedData: Optional[RewriteData] = None
+    updateId: Optional[int] = None
+
+class BatchRewriteRequest(BaseModel):
+    articles: List[RewriteItem]
+    systemPrompt: Optional[str] = None
+    maxConcurrency: int = Field(4, ge=1)
+
+# Upper bound on concurrent rewrite calls, regardless of what the client asks for
+MAX_REWRITE_CONCURRENCY = 8
+
 status = False
 
 # Endpoint to extract data for update
@@ -542,13 +644,16 @@ def store_extracted_data(request_data: RequestDataForDB):
     try:
         with conn.cursor() as cursor:
             cursor.execute(
-                "SELECT EXISTS(SELECT 1 FROM updates WHERE title = %s)", 
+                "SELECT id FROM updates WHERE title = %s", 
                 (extracted_data['title'],)
             )
-            title_exists = cursor.fetchone()[0]
+            existing_update = cursor.fetchone()
 
-            if title_exists:
-                return {"message": f"Data with title '{extracted_data['title']}' already exists in the database. Skipping insert."}
+            if existing_update:
+                return {
+                    "message": f"Data with title '{extracted_data['title']}' already exists in the database. Skipping insert.",
+                    "updateId": existing_update[0]
+                }
 
             if 'subUpdates' in extracted_data:
                 insert_sub_updates(conn, extracted_data['subUpdates'])
@@ -558,7 +663,9 @@ def store_extracted_data(request_data: RequestDataForDB):
             elif extracted_data['receiverCategory'] == 'Organization':
                 insert_organization_data(conn, extracted_data)
             
-            insert_update_data(conn, extracted_data)
+            update_id = insert_update_data(conn, extracted_data)
+            if update_id is None:
+                return {"error": f"Failed to store update with title '{extracted_data['title']}'"}
 
     except Exception as e:
         return {"error": str(e)}
@@ -566,14 +673,32 @@ def store_extracted_data(request_data: RequestDataForDB):
     finally:
         conn.close()
 
-    return {"message": "Data processed and stored successfully"}
+    return {"message": "Data processed and stored successfully", "updateId": update_id}
 
 # Endpoint to re-generate article
 @app.post("/generate-article/")
-def generate_summary(request_data: RequestData):
+def generate_summary(request_data: GenerateArticleRequest):
     global status 
     
     article = ""
+
+    given_sources = [request_data.input, request_data.extractedData, request_data.updateId]
+    if sum(source is not None for source in given_sources) != 1:
+        raise HTTPException(status_code=400, detail="Exactly one of input, extractedData or updateId is required")
+
+    # Reuse a prior extraction when given, so only the rewrite step runs
+    if request_data.extractedData is not None:
+        return regenerate_article(request_data.extractedData.dict(), request_data.systemPrompt)
+
+    if request_data.updateId is not None:
+        conn = get_db_connection()
+        try:
+            extracted_data = fetch_update_data(conn, request_data.updateId)
+        finally:
+            conn.close()
+        if extracted_data is None:
+            raise HTTPException(status_code=404, detail=f"No stored update found with id {request_data.updateId}")
+        return regenerate_article(extracted_data, request_data.systemPrompt)
     
     if request_data.input.startswith("http://") or request_data.input.startswith("https://"):
         try:
@@ -610,13 +735,53 @@ def generate_summary(request_data: RequestData):
         article = request_data.input
 
     extracted_data = generate_extracted_data(article)
-    regenerated_article = regenerate_article(extracted_data)
+    regenerated_article = regenerate_article(extracted_data, request_data.systemPrompt)
     regenerated_article = {
         "title": regenerated_article.get("title"),
         "content": regenerated_article["content"]
     }
     return regenerated_article
 
+# Endpoint to re-generate multiple articles from prior extractions
+@app.post("/generate-articles/")
+def generate_articles(request_data: BatchRewriteRequest):
+    for index, item in enumerate(request_data.articles):
+        if (item.extractedData is None) == (item.updateId is None):
+            raise HTTPException(status_code=400, detail=f"Article at index {index} needs exactly one of extractedData or updateId")
+
+    # A missing update only fails its own slot, the other articles are still rewritten
+    regenerated_articles = [None] * len(request_data.articles)
+    pending = []
+    conn = get_db_connection() if any(item.updateId is not None for item in request_data.articles) else None
+    try:
+        for index, item in enumerate(request_data.articles):
+            if item.extractedData is not None:
+                pending.append((index, item, item.extractedData.dict()))
+                continue
+            stored_data = fetch_update_data(conn, item.updateId)
+            if stored_data is None:
+                regenerated_articles[index] = {"index": index, "updateId": item.updateId, "title": None, "error": "not found"}
+            else:
+                pending.append((index, item, stored_data))
+    finally:
+        if conn is not None:
+            conn.close()
+
+    def rewrite(pending_item) -> Dict:
+        index, item, extracted_data = pending_item
+        try:
+            return regenerate_article(extracted_data, request_data.systemPrompt)
+        except Exception as e:
+            print(f"Error regenerating article '{extracted_data.get('title')}': {e}")
+            return {"index": index, "updateId": item.updateId, "title": extracted_data.get('title'), "error": str(e)}
+
+    max_workers = min(request_data.maxConcurrency, MAX_REWRITE_CONCURRENCY, max(len(pending), 1))
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for (index, _, _), result in zip(pending, executor.map(rewrite, pending)):
+            regenerated_articles[index] = result
+
+    return {"articles": regenerated_articles}
+
 # Endpoint to extract original text of article
 @app.post("/extract-original-text/")
 def extract_original_text(request_data: RequestData):